@@ -1,40 +1,127 @@
-import csv
 import argparse
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import BinaryIO, Iterator
 from pathlib import Path
-from datetime import datetime, date
+from datetime import datetime
 
 # ──────────────────────────────── CONFIG ─────────────────────────────────
 WARNING_THRESHOLD = 300  # seconds
 ERROR_THRESHOLD = 600  # seconds
+REPORT_FLUSH_ROWS = 8192  # report rows buffered before each write
+READ_BUFFER_SIZE = 1 << 20  # bytes, read buffer for the input log
+TS_CACHE_SIZE = 4096  # parsed timestamps remembered while reading a log
+JOB_POOL_SIZE = 4096  # distinct job names shared between active entries
 
-DATE_STAMP = datetime.now().strftime("%Y-%m-%d")
 LOG_DIR = Path("logs")
-LOG_PATH = LOG_DIR / f"joblog_monitor_{DATE_STAMP}.log"
 LOG_LEVEL = logging.INFO
 
 
 # ──────────────────────────────── LOG SETUP ─────────────────────────────
-def setup_logger(log_path: Path | None = None, level: int = LOG_LEVEL) -> logging.Logger:
+def _log_path() -> Path:
     """
-    Return a logger that writes to both stderr and an optional file.
+    Return today's log file path, e.g. logs/joblog_monitor_2025-07-07.log.
     """
+    return LOG_DIR / f"joblog_monitor_{datetime.now():%Y-%m-%d}.log"
+
+
+class _CachedTimeFormatter(logging.Formatter):
+    """
+    Formatter that runs strftime for asctime at most once per second of log records.
+    """
+    _cache: tuple[int, str] = (-1, "")  # (whole second, formatted stamp)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        sec = int(record.created)
+        cached_sec, stamp = self._cache
+        if sec != cached_sec:
+            stamp = time.strftime(self.default_time_format, self.converter(sec))
+            self._cache = (sec, stamp)
+        return self.default_msec_format % (stamp, record.msecs)
+
+
+class _LoggerListener(QueueListener):
+    """
+    QueueListener that attaches the logger's QueueHandler while it runs; stopping it detaches
+    that handler, so no record is queued without a thread to write it, and closes the real handlers.
+    """
+
+    def __init__(self, logger: logging.Logger, *handlers: logging.Handler) -> None:
+        log_queue: queue.SimpleQueue[logging.LogRecord | threading.Event] = queue.SimpleQueue()
+        super().__init__(log_queue, *handlers)
+        self.logger = logger
+        self.queue_handler = QueueHandler(log_queue)
+        self.running = False
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.logger.addHandler(self.queue_handler)
+        super().start()
+        self.running = True
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self.running = False
+        self.logger.removeHandler(self.queue_handler)   # detach first: nothing may follow the sentinel
+        super().stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def flush(self) -> None:
+        """
+        Block until every record queued so far has been written.
+        """
+        if self.running:
+            written = threading.Event()
+            self.queue.put_nowait(written)
+            written.wait()
+
+    def handle(self, record: logging.LogRecord | threading.Event) -> None:
+        if isinstance(record, threading.Event):     # flush() marker
+            record.set()
+        else:
+            super().handle(record)
+
+
+_listener: _LoggerListener | None = None  # the last listener setup_logger started
+
+
+def setup_logger(log_path: Path | None = None,
+                 level: int = LOG_LEVEL) -> tuple[logging.Logger, _LoggerListener]:
+    """
+    Return a logger that writes to both stderr and an optional file, and the running
+    QueueListener that performs those writes on a background thread.
+    Stop the listener before exiting so queued records are flushed; while it runs,
+    further calls return the same listener.
+    """
+    global _listener
     logger = logging.getLogger("joblog_monitor")
     logger.setLevel(level)
 
-    if not logger.handlers:
-        fmt = "%(asctime)s [%(levelname)s] %(message)s"
+    if _listener is None or not _listener.running:
+        formatter = _CachedTimeFormatter("%(asctime)s [%(levelname)s] %(message)s")
         stream_h = logging.StreamHandler()
-        stream_h.setFormatter(logging.Formatter(fmt))
-        logger.addHandler(stream_h)
+        stream_h.setFormatter(formatter)
+        handlers: list[logging.Handler] = [stream_h]
 
         if log_path:
             log_path.parent.mkdir(parents=True, exist_ok=True)
             file_h = logging.FileHandler(log_path, mode="a")
-            file_h.setFormatter(logging.Formatter(fmt))
-            logger.addHandler(file_h)
+            file_h.setFormatter(formatter)
+            handlers.append(file_h)
+
+        # The logger only enqueues records; the listener thread formats and writes them
+        _listener = _LoggerListener(logger, *handlers)
+        _listener.start()
 
-    return logger
+    return logger, _listener
 
 
 # ──────────────────────────────── USAGE ─────────────────────────────────
@@ -48,7 +135,6 @@ def usage() -> argparse.ArgumentParser:
             "Analyse a CSV job log, calculate runtimes, and emit a report "
             "highlighting jobs that exceed certain thresholds."
         ),
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
 
     # Mandatory argument: the log file to inspect
@@ -58,110 +144,204 @@ def usage() -> argparse.ArgumentParser:
         help="Full path to the CSV log file to analyse"
     )
 
-    # Optional argument: output path; if omitted then ./out/report_<timestamp>.csv
-    default_stamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-    default_out = Path("out") / f"report_{default_stamp}.csv"
+    # Optional argument: output path; if omitted then ./out/report_<timestamp>.csv (resolved in main)
     parser.add_argument(
         "-o", "--output",
         dest="outfile",
         type=Path,
-        default=default_out,
-        help="Full path (including filename) for the generated report CSV"
+        default=None,
+        help="Full path (including filename) for the generated report CSV "
+             "(default: ./out/report_<timestamp>.csv)"
     )
 
     return parser
 
 
 # ──────────────────────────────── BUSINESS LOGIC ────────────────────────────
+def _csv_row(*fields: bytes) -> bytes:
+    """
+    Build a report row, quoting fields that contain commas, quotes or line breaks the way
+    csv.writer would.
+    """
+    quoted = []
+    for f in fields:
+        if b"," in f or b'"' in f or b"\r" in f or b"\n" in f:
+            f = b'"' + f.replace(b'"', b'""') + b'"'
+        quoted.append(f)
+    return b",".join(quoted) + b"\r\n"
+
+
+class _Text:
+    """
+    Raw log field passed as a logging argument; it is only decoded if the record is emitted.
+    """
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+
+    def __str__(self) -> str:
+        return self.raw.decode("utf-8", errors="replace")
+
+
+def _log_lines(src: BinaryIO) -> Iterator[bytes]:
+    """
+    Yield the lines of src split on CR, LF or CRLF, like text mode's universal newlines,
+    reading it in READ_BUFFER_SIZE chunks.
+    """
+    tail = b""
+    while chunk := src.read(READ_BUFFER_SIZE):
+        lines = (tail + chunk).splitlines(keepends=True)
+        tail = lines.pop()  # may be incomplete, or a CR whose LF starts the next chunk
+        yield from lines
+    if tail:
+        yield tail
+
+
 def process_log(in_path: Path, out_path: Path, logger: logging.Logger) -> None:
 
-    # Dictionary with the jobs/tasks
-    active: dict[str, tuple[str, datetime]] = {}  # pid -> (job, start_dt)
+    # Dictionary with the jobs/tasks, kept as raw bytes until they are reported
+    active: dict[bytes, tuple[bytes, int]] = {}  # pid -> (job, start_secs)
+    ts_cache: dict[bytes, int] = {}  # "HH:MM:SS" -> seconds since midnight
+    job_pool: dict[bytes, bytes] = {}  # job name -> one shared copy of it
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    logger.info(f"Processing started for file {in_path}")
-
-    # Open the log file for processing and the report file for writing
-    with in_path.open() as src, out_path.open(mode="w", newline="") as dest:
-        writer = csv.writer(dest)
-        writer.writerow(["pid", "job", "duration_sec", "flag"])
+    logger.info("Processing started for file %s", in_path)
+    debug_on = logger.isEnabledFor(logging.DEBUG)  # checked once, not per empty line
 
-        for lineno, raw_line in enumerate(src, 1):
-            line = raw_line.strip()
-            if not line:
-                logger.debug(f"Line {lineno}: empty, skipped")
-                continue
+    # Open the log file and the report file, both binary: fields are copied through as raw bytes
+    with in_path.open(mode="rb", buffering=READ_BUFFER_SIZE) as src, out_path.open(mode="wb") as dest:
+        # Report rows are buffered and written in batches (CRLF, as csv.writer emits)
+        out_buf: list[bytes] = [b"pid,job,duration_sec,flag\r\n"]
 
-            parts = [p.strip() for p in line.split(sep=",", maxsplit=3)]
+        for lineno, raw_line in enumerate(_log_lines(src), 1):
+            # Split the raw line in one pass; the line ending stays on pid and is stripped with it
+            parts = raw_line.split(b",", 3)
 
             # Validate line integrity
             if len(parts) != 4:
-                logger.warning(f"Line {lineno} malformed ({len(parts)} fields): {line}")
+                line = raw_line.strip()
+                if not line:
+                    if debug_on:
+                        logger.debug("Line %d: empty, skipped", lineno)
+                    continue
+                logger.warning("Line %d malformed (%d fields): %s", lineno, len(parts), _Text(line))
                 continue
 
             ts_str, job, event, pid = parts
+            # Only strip what is compared or used as a key; the job is stripped on START,
+            # and the timestamp only when it does not already start and end with a digit
+            if not (ts_str[:1].isdigit() and ts_str[-1:].isdigit()):
+                ts_str = ts_str.strip()
+            event = event.strip()
+            pid = pid.strip()
+
+            # Validate timestamp (H:M:S, 1-2 digits each); bursts repeat the same second, so parses are memoized
+            ts_secs = ts_cache.get(ts_str)
+            if ts_secs is None:
+                try:
+                    if len(ts_str) == 8:    # the usual zero-padded HH:MM:SS, decoded from the digit bytes
+                        h1, h2, c1, m1, m2, c2, s1, s2 = ts_str
+                        if not (c1 == c2 == 58 and 48 <= h1 <= 57 and 48 <= h2 <= 57 and 48 <= m1 <= 57
+                                and 48 <= m2 <= 57 and 48 <= s1 <= 57 and 48 <= s2 <= 57):
+                            raise ValueError(ts_str)
+                        h = (h1 - 48) * 10 + h2 - 48
+                        m = (m1 - 48) * 10 + m2 - 48
+                        s = (s1 - 48) * 10 + s2 - 48
+                    else:   # unpadded fields such as 9:00:00 or 10:5:3, as strptime("%H:%M:%S") accepts
+                        fields = ts_str.split(b":")
+                        if len(fields) != 3 or not all(0 < len(f) <= 2 and f.isdigit() for f in fields):
+                            raise ValueError(ts_str)
+                        h, m, s = map(int, fields)
+                    if h >= 24 or m >= 60 or s >= 60:
+                        raise ValueError(ts_str)
+                except ValueError:
+                    logger.warning("Line %d bad timestamp '%s'", lineno, _Text(ts_str))
+                    continue
+                ts_secs = h * 3600 + m * 60 + s  # seconds since midnight
+                if len(ts_cache) >= TS_CACHE_SIZE:
+                    ts_cache.clear()  # logs are roughly time-ordered, old seconds rarely come back
+                ts_cache[ts_str] = ts_secs
+
+            # Events are normally already upper-case; only other spellings pay for upper()
+            if event != b"START" and event != b"END":
+                event = event.upper()
+                if event != b"START" and event != b"END":
+                    logger.warning("Line %d unknown event '%s'", lineno, _Text(event))
+                    continue
 
-            # Validate timestamp
-            try:
-                t = datetime.strptime(ts_str, "%H:%M:%S").time()
-                ts = datetime.combine(date.today(), t)
-            except ValueError:
-                logger.warning(f"Line {lineno} bad timestamp '{ts_str}'")
-                continue
-
-            event = event.upper()
-            if event not in {"START", "END"}:
-                logger.warning(f"Line {lineno} unknown event '{event}'")
-                continue
-
-            if event == "START":
-                if pid in active:
-                    logger.warning(f"Line {lineno} duplicate START for pid {pid}; overwriting previous start")
-                active[pid] = (job, ts)
+            if event == b"START":
+                # Job names repeat a lot; keep one object per name instead of one per START
+                job = job.strip()
+                job = job_pool.setdefault(job, job)
+                if len(job_pool) > JOB_POOL_SIZE:
+                    job_pool.clear()
+                entry = (job, ts_secs)
+                if active.setdefault(pid, entry) is not entry:    # single lookup unless duplicated
+                    logger.warning("Line %d duplicate START for pid %s; overwriting previous start",
+                                   lineno, _Text(pid))
+                    active[pid] = entry
 
             else:   # END
-                if pid not in active:
-                    logger.warning(f"Line {lineno} END for pid {pid} with no START")
+                entry = active.pop(pid, None)
+                if entry is None:
+                    logger.warning("Line %d END for pid %s with no START", lineno, _Text(pid))
                     continue
-                job_desc, start_ts = active.pop(pid)
-                duration = (ts - start_ts).total_seconds()
+                job_desc, start_secs = entry
+                duration = ts_secs - start_secs
+                if duration < 0:    # job ran past midnight
+                    duration += 86400
 
-                flag = ""
+                flag = b""
                 if duration >= ERROR_THRESHOLD:
-                    flag = "ERROR"
+                    flag = b"ERROR"
                 elif duration >= WARNING_THRESHOLD:
-                    flag = "WARNING"
+                    flag = b"WARNING"
 
                 # Write to the report if the threshold is exceeded
                 if flag:
-                    writer.writerow([pid, job_desc, f"{duration:.0f}", flag])
+                    row = b"%s,%s,%d,%s\r\n" % (pid, job_desc, duration, flag)
+                    # Only the trailing CRLF may be a line break; anything else needs quoting
+                    if row.count(b",") != 3 or b'"' in row or row.count(b"\r") != 1 or row.count(b"\n") != 1:
+                        row = _csv_row(pid, job_desc, b"%d" % duration, flag)
+                    out_buf.append(row)
+                    if len(out_buf) >= REPORT_FLUSH_ROWS:
+                        dest.write(b"".join(out_buf))
+                        out_buf.clear()
+
+        dest.write(b"".join(out_buf))
 
     # Anything left open means the job never ended
-    for pid, (job_desc, start_ts) in active.items():
-        logger.info(f"PID {pid} ({job_desc}) still running, no END found (started {start_ts.time()})")
+    for pid, (job_desc, start_secs) in active.items():
+        logger.info("PID %s (%s) still running, no END found (started %02d:%02d:%02d)",
+                    _Text(pid), _Text(job_desc), start_secs // 3600, (start_secs // 60) % 60, start_secs % 60)
 
-    logger.info(f"Processing finished. Report saved to {out_path}")
+    logger.info("Processing finished. Report saved to %s", out_path)
 
 
 # ──────────────────────────────── MAIN ────────────────────────────
 def main(argv: list[str] | None = None) -> None:
-    logger = setup_logger(LOG_PATH, LOG_LEVEL)  # Initialize the logger
-    logger.info(f"Program started.")
-
-    # Parse the arguments
-    parser = usage()
-    args = parser.parse_args(argv)
-    log_file = args.logfile
-    out_file = args.outfile
-
-    logger.debug(f"Provided arguments: {args}")
-    logger.debug(f"Log file to analyze: {log_file}")
-    logger.debug(f"Report file: {out_file}")
-
-    # Process the log file
-    process_log(log_file, out_file, logger)
-
-    logger.info(f"Program ended.")
+    logger, listener = setup_logger(_log_path(), LOG_LEVEL)  # Initialize the logger
+    try:
+        logger.info("Program started.")
+        listener.flush()  # written before argparse can print usage or errors to stderr
+
+        # Parse the arguments
+        parser = usage()
+        args = parser.parse_args(argv)
+        log_file = args.logfile
+        out_file = args.outfile or Path("out") / f"report_{datetime.now():%Y-%m-%d-%H-%M-%S}.csv"
+
+        logger.debug("Provided arguments: %s", args)
+        logger.debug("Log file to analyze: %s", log_file)
+        logger.debug("Report file: %s", out_file)
+
+        # Process the log file
+        process_log(log_file, out_file, logger)
+
+        logger.info("Program ended.")
+    finally:
+        listener.stop()  # flush queued log records
 
 
 if __name__ == "__main__":